@@ -1,75 +1,618 @@
 import os
+import sys
+import io
+import errno
 import shutil
+import stat
+import mmap
 import json
 import argparse
 import hashlib
-import difflib
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
+# Optional accelerated hashers; MD5 is the fallback so plain Python still works
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+# C implementation of difflib's matcher; same opcodes, much faster on big files
+try:
+    from cdifflib import CSequenceMatcher as SequenceMatcher
+except ImportError:
+    from difflib import SequenceMatcher
+# Compressed object storage when available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+# Full gitignore semantics for .vibeignore when available
+try:
+    import pathspec
+except ImportError:
+    pathspec = None
+
 # --- Configuration ---
 REPO_DIR_NAME = ".vibevc"
-MANIFEST_FILE = "manifest.json"
+MANIFEST_FILE = "manifest.log"  # JSON Lines, one commit per line, append-only
+LEGACY_MANIFEST_FILE = "manifest.json"  # Pre-log format: one JSON array, migrated on first write
 SNAPSHOTS_DIR = "snapshots"
+OBJECTS_DIR = "objects"  # Content-addressed blobs, inside SNAPSHOTS_DIR
+STORAGE_OBJECTS = "objects"  # Commit 'storage' value; commits without it are full snapshot folders
+ZSTD_SUFFIX = ".zst"  # Marks a zstd-compressed object; objects without it are stored raw
+ZSTD_LEVEL = 3
+IGNORE_FILE = ".vibeignore"
 IGNORE_PATTERNS = {REPO_DIR_NAME, "__pycache__", ".git", ".DS_Store", "venv", ".idea", ".vscode"}
+# Build output folders; only directories, so a './build' script is still tracked
+IGNORE_DIRS = {"node_modules", "target", "dist", "build"}
+# The file_map hash is only used for change detection, so the fastest available one wins.
+# Each commit records its algorithm; commits without one were hashed with MD5.
+HASH_ALGO = "blake3" if blake3 else "xxh3_128" if xxhash else "md5"
+LEGACY_HASH_ALGO = "md5"
+# Objects are shared by every file with the same name, so that name must be collision-resistant
+OBJECT_ALGO = "blake3" if blake3 else "sha256"
+HASH_CHUNK_SIZE = 1 << 20  # 1 MiB per read keeps per-chunk interpreter overhead negligible
+HASH_MMAP_THRESHOLD = 1 << 20  # Larger files are hashed straight from a memory map
+# Hashers release the GIL, so a thread pool overlaps file I/O and hashing
+try:
+    _CPU_COUNT = len(os.sched_getaffinity(0))
+except AttributeError:
+    _CPU_COUNT = os.cpu_count() or 1
+HASH_WORKERS = min(32, _CPU_COUNT * 4)
+# Stat-cache entries modified this close to (or after) their commit's scan are rehashed,
+# covering coarse filesystem timestamps (FAT rounds to 2 s)
+RACY_WINDOW_NS = 2 * 10**9
 
 class VibeVC:
     def __init__(self, root_path="."):
         self.root = Path(root_path).resolve()
         self.repo_path = self.root / REPO_DIR_NAME
         self.snapshots_path = self.repo_path / SNAPSHOTS_DIR
+        self.objects_path = self.snapshots_path / OBJECTS_DIR
         self.manifest_path = self.repo_path / MANIFEST_FILE
-
-    def _get_files(self, directory):
-        """Recursively list all files in directory, excluding ignored ones."""
-        file_list = []
-        for root, dirs, files in os.walk(directory):
-            # Modify dirs in-place to skip ignored directories
-            dirs[:] = [d for d in dirs if d not in IGNORE_PATTERNS]
-            
-            for file in files:
-                if file in IGNORE_PATTERNS:
+        self.legacy_manifest_path = self.repo_path / LEGACY_MANIFEST_FILE
+        self._manifest_cache = None  # Loaded history, dropped whenever the manifest is written
+        self._tag_index = None  # {version_tag: entry} over _manifest_cache
+        self._compressor = None  # Created on first use and reused for every object
+        self.ignore_matcher = self._load_ignore_file()
+
+    def _load_ignore_file(self):
+        """Compile the root .vibeignore into a matcher(rel_path, is_dir), or None if absent."""
+        ignore_path = self.root / IGNORE_FILE
+        if not ignore_path.is_file():
+            return None
+        lines = ignore_path.read_text(encoding='utf-8').splitlines()
+
+        if pathspec:
+            spec = pathspec.GitIgnoreSpec.from_lines(lines)
+            return lambda rel_path, is_dir: spec.match_file(rel_path + "/" if is_dir else rel_path)
+
+        # Fallback: the common gitignore subset (no '!' negation)
+        rules = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith(("#", "!")):
+                continue
+            dir_only = line.endswith("/")
+            # A slash anywhere but the end anchors the pattern to the root
+            anchored = "/" in line.rstrip("/")
+            rules.append((self._glob_to_regex(line.strip("/")), dir_only, anchored))
+
+        def matches(rel_path, is_dir):
+            name = rel_path.rsplit("/", 1)[-1]
+            for regex, dir_only, anchored in rules:
+                if dir_only and not is_dir:
                     continue
-                full_path = Path(root) / file
-                rel_path = full_path.relative_to(self.root)
-                file_list.append(str(rel_path)) # Store as string for JSON serialization
-        return sorted(file_list)
-
-    def _hash_file(self, filepath):
-        """Generate MD5 hash of a file for precise change detection."""
-        hasher = hashlib.md5()
+                if regex.fullmatch(rel_path if anchored else name):
+                    return True
+            return False
+        return matches
+
+    @staticmethod
+    def _glob_to_regex(pattern):
+        """Compile a gitignore glob; as in git, only '**' may match across '/'."""
+        parts = []
+        i, n = 0, len(pattern)
+        while i < n:
+            c = pattern[i]
+            if pattern.startswith("**/", i):
+                parts.append("(?:.*/)?")  # Zero or more leading directories
+                i += 3
+                continue
+            if pattern.startswith("**", i) and (i + 2 == n and (i == 0 or pattern[i - 1] == "/")):
+                parts.append(".*")  # Trailing '/**': everything inside
+                i += 2
+                continue
+            if c == "\\" and i + 1 < n:
+                parts.append(re.escape(pattern[i + 1]))
+                i += 2
+                continue
+            if c == "*":
+                parts.append("[^/]*")
+            elif c == "?":
+                parts.append("[^/]")
+            elif c == "[":
+                j = i + 1
+                if j < n and pattern[j] in "!^":
+                    j += 1
+                if j < n and pattern[j] == "]":
+                    j += 1  # A leading ']' is part of the set
+                end = pattern.find("]", j)
+                if end == -1:
+                    parts.append(re.escape(c))
+                else:
+                    body = pattern[i + 1:end].replace("\\", "\\\\")
+                    if body[:1] in ("!", "^"):
+                        body = "^/" + body[1:]
+                    parts.append(f"[{body}]")
+                    i = end + 1
+                    continue
+            else:
+                parts.append(re.escape(c))
+            i += 1
+        return re.compile("".join(parts))
+
+    def _iter_files(self, directory, ignore=True):
+        """Yield a DirEntry for every file under directory, skipping ignored ones if `ignore`."""
+        # This loop runs once per entry in the tree, so everything it touches is a local
+        matcher = self.ignore_matcher if ignore else None
+        ignored_names = IGNORE_PATTERNS if ignore else frozenset()
+        ignored_dirs = IGNORE_DIRS if ignore else frozenset()
+        prefix_len = len(os.path.join(str(directory), ""))
+        sep = os.sep
+        scandir = os.scandir
+        stack = [str(directory)]
+        push, pop = stack.append, stack.pop
+        while stack:
+            with scandir(pop()) as entries:
+                for entry in entries:
+                    if entry.name in ignored_names:
+                        continue
+                    # DirEntry caches the type from the directory read, so no extra stat
+                    if entry.is_dir():
+                        # Like os.walk, don't follow symlinked directories.
+                        # Checked before descending, so ignored trees are never read.
+                        if entry.name in ignored_dirs or entry.is_symlink() or (matcher and matcher(entry.path[prefix_len:].replace(sep, "/"), True)):
+                            continue
+                        push(entry.path)
+                    elif not (matcher and matcher(entry.path[prefix_len:].replace(sep, "/"), False)):
+                        yield entry
+
+    def _get_files(self, directory, ignore=True):
+        """Recursively map all files in directory (relative paths, sorted) to their DirEntry.
+
+        Keeping the DirEntry lets later steps reuse its cached stat() instead of
+        stat'ing every path again.
+        """
+        prefix_len = len(os.path.join(str(directory), ""))
+        # Relative paths are plain strings for JSON serialization
+        files = {entry.path[prefix_len:]: entry for entry in self._iter_files(directory, ignore)}
+        # Sorting bare keys is cheaper than sorting (key, entry) tuples
+        return {f: files[f] for f in sorted(files)}
+
+    @staticmethod
+    def _open_noatime(filepath):
+        """Open a file read-only, without an atime update where the OS allows it."""
+        flags = os.O_RDONLY | getattr(os, 'O_BINARY', 0) | getattr(os, 'O_CLOEXEC', 0)
+        noatime = getattr(os, 'O_NOATIME', 0)  # Linux only
+        if noatime:
+            try:
+                return os.open(filepath, flags | noatime)
+            except PermissionError:
+                pass  # O_NOATIME is only allowed on files we own
+        return os.open(filepath, flags)
+
+    @staticmethod
+    def _new_hasher(algo):
+        """Create a hasher for `algo`, which may be one recorded by an older commit."""
+        if algo == "blake3":
+            if blake3 is None:
+                raise RuntimeError("This commit was hashed with BLAKE3; install the 'blake3' package to compare against it.")
+            # SIMD, and spreads large inputs across all cores
+            return blake3.blake3(max_threads=blake3.blake3.AUTO)
+        if algo == "xxh3_128":
+            if xxhash is None:
+                raise RuntimeError("This commit was hashed with xxHash; install the 'xxhash' package to compare against it.")
+            return xxhash.xxh3_128()
+        return hashlib.new(algo)
+
+    def _hash_file(self, filepath, algo=HASH_ALGO):
+        """Hash a file with `algo` for precise change detection."""
+        hasher = self._new_hasher(algo)
         try:
-            with open(filepath, 'rb') as f:
-                # Read in chunks to handle large files efficiently
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hasher.update(chunk)
+            # Hashing is a read-only scan, so don't make it write atime metadata back.
+            # Unbuffered: we read straight into our own reusable buffer
+            with open(self._open_noatime(filepath), 'rb', buffering=0) as f:
+                size = os.fstat(f.fileno()).st_size
+                if size > HASH_MMAP_THRESHOLD:
+                    # Hash the page cache in place instead of copying it out with read()
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                            mm.madvise(mmap.MADV_SEQUENTIAL)
+                        hasher.update(mm)
+                    return hasher.hexdigest()
+
+                buf = bytearray(max(1, min(size, HASH_CHUNK_SIZE)))
+                view = memoryview(buf)
+                for n in iter(lambda: f.readinto(buf), 0):
+                    hasher.update(view[:n])
             return hasher.hexdigest()
         except FileNotFoundError:
             return None
 
+    def _hash_many(self, rel_paths, algo=HASH_ALGO, base=None):
+        """Hash files (relative to `base`, default the root) in parallel. Returns {rel_path: hash}."""
+        base = base or self.root
+        rel_paths = list(rel_paths)
+        if len(rel_paths) < 2:
+            return {f: self._hash_file(base / f, algo) for f in rel_paths}
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+            hashes = pool.map(lambda f: self._hash_file(base / f, algo), rel_paths)
+            return dict(zip(rel_paths, hashes))
+
+    def _track_files(self, files, last_commit=None, algo=HASH_ALGO):
+        """Build {rel_path: {"h": hash, "m": mtime_ns, "s": size, "i": inode, "p": mode}} from {rel_path: DirEntry}.
+
+        Like git's index, a file whose stat matches its entry in last_commit is assumed
+        unchanged and keeps its recorded hash (and object name "o"); only the rest get
+        read and hashed.
+        Entries modified at or after last_commit was scanned are "racily clean" (an
+        edit in the same timestamp tick keeps the stat) and are rehashed too.
+        Files that disappear in the meantime are left out.
+        """
+        last_file_map = last_commit.get('file_map', {}) if last_commit else {}
+        # Commits without a scan time predate the rule; trust none of their entries
+        racy_cutoff = last_commit.get('scanned_ns', 0) - RACY_WINDOW_NS if last_commit else 0
+        records = {}
+        to_hash = []
+        for f, entry in files.items():
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            record = {"m": st.st_mtime_ns, "s": st.st_size, "i": st.st_ino, "p": stat.S_IMODE(st.st_mode)}
+            last = last_file_map.get(f)
+            # Older manifests store bare hash strings and have no stat to compare
+            if (isinstance(last, dict) and last.get("m", racy_cutoff) < racy_cutoff
+                    and all(last.get(k) == record[k] for k in ("m", "s", "i"))):
+                record["h"] = last["h"]
+                if "o" in last:
+                    record["o"] = last["o"]
+            else:
+                to_hash.append(f)
+            records[f] = record
+
+        for f, file_hash in self._hash_many(to_hash, algo).items():
+            if file_hash is None:
+                del records[f]
+            else:
+                records[f]["h"] = file_hash
+        return records
+
+    @staticmethod
+    def _entry_hash(entry):
+        """Content hash of a file_map entry (older manifests store the bare hash)."""
+        return entry if isinstance(entry, str) else entry["h"]
+
+    @staticmethod
+    def _object_name(entry):
+        """Object a file_map entry is stored under; older objects commits used the hash."""
+        return entry["o"] if isinstance(entry, dict) and "o" in entry else VibeVC._entry_hash(entry)
+
+    @staticmethod
+    def _dumps_line(entry):
+        """Serialize one manifest entry as a single JSON line."""
+        if orjson:
+            return orjson.dumps(entry) + b"\n"
+        return json.dumps(entry, separators=(",", ":")).encode('utf-8') + b"\n"
+
     def _load_manifest(self):
+        """Return the commit history, reading the manifest only once per instance."""
+        if self._manifest_cache is None:
+            self._manifest_cache = self._read_manifest()
+            self._tag_index = {}
+            for entry in self._manifest_cache:
+                # Old, timestamp-only commits have no version; first match wins as before
+                if entry.get('version') is not None:
+                    self._tag_index.setdefault(entry['version'], entry)
+        return self._manifest_cache
+
+    def _invalidate_manifest(self):
+        self._manifest_cache = None
+        self._tag_index = None
+
+    def _read_manifest(self):
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        loads = orjson.loads if orjson else json.loads
         if not self.manifest_path.exists():
-            return []
-        try:
-            with open(self.manifest_path, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print("(!) Error: Manifest file is corrupted.")
-            return []
+            if not self.legacy_manifest_path.exists():
+                return []
+            try:
+                return loads(self.legacy_manifest_path.read_bytes())
+            except json.JSONDecodeError:
+                print("(!) Error: Manifest file is corrupted.")
+                return []
+
+        manifest = []
+        corrupted = 0
+        for line in self.manifest_path.read_bytes().splitlines():
+            if not line.strip():
+                continue
+            try:
+                manifest.append(loads(line))
+            except json.JSONDecodeError:
+                # e.g. a commit interrupted mid-append; the other commits are still fine
+                corrupted += 1
+        if corrupted:
+            print(f"(!) Warning: Skipped {corrupted} corrupted manifest line(s). Run 'compact' to drop them.")
+        return manifest
 
     def _save_manifest(self, data):
-        with open(self.manifest_path, 'w') as f:
-            json.dump(data, f, indent=4)
+        """Rewrite the whole manifest log (init, migration and compaction only)."""
+        self._invalidate_manifest()
+        self._atomic_write(self.manifest_path, b"".join(self._dumps_line(entry) for entry in data))
+        if self.legacy_manifest_path.exists():
+            self.legacy_manifest_path.unlink()
+
+    def _append_manifest(self, entry):
+        """Record a new commit with a single append instead of rewriting history."""
+        self._invalidate_manifest()
+        if not self.manifest_path.exists():
+            # Migrate the old manifest.json, if any, into the log first
+            self._save_manifest(self._load_manifest() + [entry])
+            return
+        line = self._dumps_line(entry)
+        with open(self.manifest_path, 'ab+') as f:
+            # Don't let a torn previous line swallow this one
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _atomic_write(self, path, payload):
+        """Write bytes to path via a synced temp file and rename, so a crash can't leave it torn."""
+        tmp_path = path.with_suffix('.tmp')
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            view = memoryview(payload)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+
+    def _object_path(self, file_hash):
+        return self.objects_path / file_hash[:2] / file_hash[2:]
+
+    @staticmethod
+    def _kernel_copy(in_fd, out_fd):
+        """Copy in_fd to out_fd without passing the bytes through Python.
+
+        copy_file_range can reflink on Btrfs/XFS and copies in-kernel elsewhere;
+        sendfile is the older in-kernel path. Returns False if neither works here.
+        """
+        unsupported = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.ENOTSUP, errno.EOPNOTSUPP}
+        size = os.fstat(in_fd).st_size
+        for method in ("copy_file_range", "sendfile"):
+            if not hasattr(os, method):
+                continue
+            offset = 0
+            try:
+                while offset < size:
+                    if method == "copy_file_range":
+                        sent = os.copy_file_range(in_fd, out_fd, size - offset, offset, offset)
+                    else:
+                        sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+                    if not sent:  # Source shrank under us
+                        break
+                    offset += sent
+                return True
+            except OSError as e:
+                if e.errno not in unsupported:
+                    raise
+            # Throw away any partial copy before the next attempt
+            os.ftruncate(out_fd, 0)
+            os.lseek(out_fd, 0, os.SEEK_SET)
+        return False
+
+    def _fast_copy(self, src, dst):
+        """Copy file contents like shutil.copyfile, in the kernel when possible."""
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            copied = self._kernel_copy(fsrc.fileno(), fdst.fileno())
+        if not copied:
+            shutil.copyfile(src, dst)
+
+    def _has_object(self, name):
+        obj_path = self._object_path(name)
+        return obj_path.exists() or obj_path.with_name(obj_path.name + ZSTD_SUFFIX).exists()
+
+    def _store_blob(self, src, record):
+        """Copy src into the object store, named by the OBJECT_ALGO digest of the bytes stored.
+
+        src may have changed since `record` (from _track_files) was taken; the copy
+        is hashed as it is written, and `record` is updated to describe it if so.
+        Sets record["o"] to the object's name.
+        """
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+        # Write aside and rename so a crash never leaves a truncated object
+        tmp_path = self.objects_path / f".{os.getpid()}.tmp"
+        with open(self._open_noatime(src), 'rb', buffering=0) as fin:
+            st = os.fstat(fin.fileno())
+            if zstandard:
+                if self._compressor is None:
+                    self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+                hashers = {algo: self._new_hasher(algo) for algo in (HASH_ALGO, OBJECT_ALGO)}
+                size = 0
+                with open(tmp_path, 'wb') as fout, self._compressor.stream_writer(fout, closefd=False) as writer:
+                    for chunk in iter(lambda: fin.read(HASH_CHUNK_SIZE), b""):
+                        for hasher in hashers.values():
+                            hasher.update(chunk)
+                        writer.write(chunk)
+                        size += len(chunk)
+                digests = {algo: hasher.hexdigest() for algo, hasher in hashers.items()}
+            else:
+                with open(tmp_path, 'wb') as fout:
+                    if not self._kernel_copy(fin.fileno(), fout.fileno()):
+                        shutil.copyfileobj(fin, fout)
+                # Hash the copy itself (still in the page cache): it is what gets stored
+                digests = {algo: self._hash_file(tmp_path, algo) for algo in {HASH_ALGO, OBJECT_ALGO}}
+                size = os.path.getsize(tmp_path)
+
+        if digests[HASH_ALGO] != record["h"]:
+            # Edited after it was hashed: record what was stored, not what was hashed
+            record.update(h=digests[HASH_ALGO], s=size, m=st.st_mtime_ns, i=st.st_ino, p=stat.S_IMODE(st.st_mode))
+        name = record["o"] = digests[OBJECT_ALGO]
+        if self._has_object(name):
+            os.unlink(tmp_path)
+            return
+        obj_path = self._object_path(name)
+        obj_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, obj_path.with_name(obj_path.name + ZSTD_SUFFIX) if zstandard else obj_path)
+
+    def _snapshot_files(self, commit):
+        """List the files stored for a commit."""
+        if 'file_map' in commit:
+            # file_map already names every stored file, no need to walk anything
+            return sorted(commit['file_map'])
+        # Oldest commits: walk the snapshot dir directly to get the actual files stored
+        return list(self._get_files(self.snapshots_path / commit['version'], ignore=False))
+
+    def _snapshot_path(self, commit, rel_path):
+        """Where the stored copy of rel_path lives for a commit."""
+        if commit.get('storage') == STORAGE_OBJECTS:
+            obj_path = self._object_path(self._object_name(commit['file_map'][rel_path]))
+            zst_path = obj_path.with_name(obj_path.name + ZSTD_SUFFIX)
+            return zst_path if zst_path.exists() else obj_path
+        return self.snapshots_path / commit['version'] / rel_path
+
+    def _is_compressed(self, commit, stored_path):
+        # Only object names are ours to interpret; snapshot folders hold files as-is
+        return commit.get('storage') == STORAGE_OBJECTS and stored_path.suffix == ZSTD_SUFFIX
+
+    def _decompressor(self):
+        if zstandard is None:
+            raise RuntimeError("This snapshot is zstd-compressed; install the 'zstandard' package to read it.")
+        return zstandard.ZstdDecompressor()
+
+    def _open_snapshot(self, commit, rel_path):
+        """Open the stored copy of rel_path in commit for binary reading."""
+        stored_path = self._snapshot_path(commit, rel_path)
+        if self._is_compressed(commit, stored_path):
+            return self._decompressor().stream_reader(open(stored_path, 'rb'), closefd=True)
+        return open(stored_path, 'rb')
+
+    def _restore_file(self, commit, rel_path, stored_path, dst):
+        """Write a commit's stored copy of rel_path (from _snapshot_path) to dst, with its metadata."""
+        if self._is_compressed(commit, stored_path):
+            # Fail before dst is created, not after truncating it
+            decompressor = self._decompressor()
+            with open(stored_path, 'rb') as fin, open(dst, 'wb') as fout:
+                decompressor.copy_stream(fin, fout)
+        else:
+            self._fast_copy(stored_path, dst)
+
+        if commit.get('storage') != STORAGE_OBJECTS:
+            # Snapshot folders hold a per-version copy with the file's own metadata
+            shutil.copystat(stored_path, dst)
+            return
+        # Objects are shared by every file with that content; use this file's record
+        record = commit['file_map'][rel_path]
+        if isinstance(record, dict):
+            if "p" in record:
+                os.chmod(dst, record["p"])
+            os.utime(dst, ns=(record["m"], record["m"]))
+
+    def _differing_files(self, commit, files, first_only=False):
+        """Return the set of files ({rel_path: DirEntry}, all stored in commit) whose content differs.
+
+        A size mismatch settles it without reading anything. Otherwise the current
+        hash (stat-cached against the commit) is compared with the recorded one.
+        With `first_only`, stop after the size pass if it already found a difference.
+        """
+        algo = commit.get('hash_algo', LEGACY_HASH_ALGO)
+        file_map = commit.get('file_map', {})
+        differing = set()
+        same_size = {}
+        for f, entry in files.items():
+            recorded = file_map.get(f)
+            if isinstance(recorded, dict):
+                snap_size = recorded["s"]
+            elif commit.get('storage') == STORAGE_OBJECTS:
+                snap_size = None  # Objects may not be stored byte-for-byte
+            else:
+                try:
+                    snap_size = os.stat(self._snapshot_path(commit, f)).st_size
+                except FileNotFoundError:
+                    snap_size = None  # Lost snapshot copy; the hash comparison flags it
+            try:
+                size = entry.stat().st_size
+            except FileNotFoundError:
+                size = None
+            if snap_size is not None and size != snap_size:
+                differing.add(f)
+                if first_only:
+                    return differing
+            else:
+                same_size[f] = entry
+
+        current_state = self._track_files(same_size, commit, algo)
+        # Only the oldest commits lack a recorded hash; read their snapshot copies
+        unrecorded = [f for f in same_size if f not in file_map]
+        snapshot_hashes = self._hash_many(unrecorded, algo, base=self.snapshots_path / commit['version'])
+        for f in same_size:
+            snap_hash = snapshot_hashes[f] if f in snapshot_hashes else self._entry_hash(file_map[f])
+            if f not in current_state or current_state[f]["h"] != snap_hash:
+                differing.add(f)
+        return differing
+
+    @staticmethod
+    def _unified_diff(a, b, fromfile, tofile, n=3):
+        """Same output as difflib.unified_diff, but driven by the module's SequenceMatcher."""
+        def format_range(start, stop):
+            length = stop - start
+            if length == 1:
+                return f"{start + 1}"
+            return f"{start + 1 if length else start},{length}"
+
+        started = False
+        for group in SequenceMatcher(None, a, b).get_grouped_opcodes(n):
+            if not started:
+                started = True
+                yield f"--- {fromfile}\n"
+                yield f"+++ {tofile}\n"
+            first, last = group[0], group[-1]
+            yield f"@@ -{format_range(first[1], last[2])} +{format_range(first[3], last[4])} @@\n"
+            for tag, i1, i2, j1, j2 in group:
+                if tag == 'equal':
+                    for line in a[i1:i2]:
+                        yield ' ' + line
+                    continue
+                if tag in ('replace', 'delete'):
+                    for line in a[i1:i2]:
+                        yield '-' + line
+                if tag in ('replace', 'insert'):
+                    for line in b[j1:j2]:
+                        yield '+' + line
 
     def _get_commit_by_tag(self, tag):
         """Finds a commit by its version tag."""
-        manifest = self._load_manifest()
-        for entry in manifest:
-            # Use .get('version') to safely access the key, returning None if missing.
-            # This handles old, timestamp-only commits gracefully.
-            if entry.get('version') == tag:
-                return entry
-        return None
+        self._load_manifest()
+        return self._tag_index.get(tag)
 
     def init(self):
         """Initialize the repository."""
@@ -108,37 +651,40 @@ class VibeVC:
                 return
         else:
             version_tag = unique_id
+            # Two commits within the same second would share the ID; suffix it
+            suffix = 1
+            while self._get_commit_by_tag(version_tag):
+                suffix += 1
+                version_tag = f"{unique_id}-{suffix}"
 
-        # 2. Prepare Snapshot Folder
-        snapshot_folder = self.snapshots_path / version_tag
-        snapshot_folder.mkdir()
-
+        # 2. Track hashes and stats; files untouched since the last commit aren't rehashed
+        manifest = self._load_manifest()
+        last_commit = None
+        if (manifest and manifest[-1].get('hash_algo', LEGACY_HASH_ALGO) == HASH_ALGO
+                and manifest[-1].get('object_algo', OBJECT_ALGO) == OBJECT_ALGO):
+            last_commit = manifest[-1]
+        scanned_ns = time.time_ns()  # Taken before any stat so later edits count as racy
         files = self._get_files(self.root)
-        file_tracking = {} # Dictionary to store file: hash mappings
+        file_tracking = self._track_files(files, last_commit) # Dictionary to store file: hash/stat mappings
 
-        # 3. Copy files and track hashes
+        # 3. Store contents by hash; unchanged files are already in the store
         print(f"📦 Packaging version {version_tag}...")
-        for file_rel_path in files:
-            src = self.root / file_rel_path
-            dst = snapshot_folder / file_rel_path
-            
-            # Calculate hash for accurate tracking
-            file_hash = self._hash_file(src)
-            file_tracking[file_rel_path] = file_hash
-            
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src, dst)
+        for file_rel_path, record in file_tracking.items():
+            if "o" not in record or not self._has_object(record["o"]):
+                self._store_blob(self.root / file_rel_path, record)
 
         # 4. Update Manifest with detailed file tracking
-        manifest = self._load_manifest()
-        manifest.append({
+        self._append_manifest({
             "version": version_tag,
             "id": unique_id,
             "timestamp": timestamp,
             "message": message,
+            "hash_algo": HASH_ALGO,
+            "object_algo": OBJECT_ALGO,
+            "storage": STORAGE_OBJECTS,
+            "scanned_ns": scanned_ns,
             "file_map": file_tracking  # Now we know exactly what looked like what
         })
-        self._save_manifest(manifest)
 
         print(f"✅ Snapshot saved: [{version_tag}] {message}")
 
@@ -180,23 +726,14 @@ class VibeVC:
         
         current_files = self._get_files(self.root)
         
-        modified = []
-        new_files = []
-        deleted = []
-
-        # Check existing and new
-        for f in current_files:
-            if f not in last_file_map:
-                new_files.append(f)
-            else:
-                curr_hash = self._hash_file(self.root / f)
-                if curr_hash != last_file_map[f]:
-                    modified.append(f)
+        # New and deleted fall out of set arithmetic on the key views
+        current, previous = current_files.keys(), last_file_map.keys()
+        new_files = sorted(current - previous)
+        deleted = sorted(previous - current)
 
-        # Check deleted
-        for f in last_file_map:
-            if f not in current_files:
-                deleted.append(f)
+        # Only files present on both sides need their contents compared
+        common = current & previous
+        modified = sorted(self._differing_files(last_commit, {f: current_files[f] for f in common}))
 
         if not (modified or new_files or deleted):
             print("✨ Working directory clean")
@@ -223,7 +760,8 @@ class VibeVC:
             print(f"(!) Version {version_tag} not found.")
             return
 
-        target_snapshot = self.snapshots_path / version_tag
+        # One walk serves both the safety check and the wipe
+        current_files = self._get_files(self.root)
 
         # Safety Check
         if not force:
@@ -232,41 +770,52 @@ class VibeVC:
             if manifest:
                 last_commit = manifest[-1]
                 last_file_map = last_commit.get('file_map', {})
-                current_files = self._get_files(self.root)
-                is_dirty = False
+                # Any new file means dirty, no stat or hashing needed
+                is_dirty = not current_files.keys() <= last_file_map.keys()
                 
-                for f in current_files:
-                    if f not in last_file_map or self._hash_file(self.root / f) != last_file_map[f]:
-                        is_dirty = True
-                        break
+                if not is_dirty:
+                    is_dirty = bool(self._differing_files(last_commit, current_files, first_only=True))
                 
                 if is_dirty:
                     print("(!) Uncommitted changes detected.")
                     print("    Use '--force' to overwrite.")
                     return
 
+        # Make sure every stored copy can be read before anything gets deleted
+        stored = {f: self._snapshot_path(target_commit, f) for f in self._snapshot_files(target_commit)}
+        missing = [f for f, path in stored.items() if not path.exists()]
+        if missing:
+            print(f"(!) Error: Stored data for {len(missing)} file(s) of {version_tag} is missing (e.g. {missing[0]}).")
+            return
+        if zstandard is None and any(self._is_compressed(target_commit, path) for path in stored.values()):
+            print("(!) Error: This snapshot is zstd-compressed; install the 'zstandard' package to restore it.")
+            return
+
         print(f"Restoring version {version_tag}...")
         
-        # 1. Wipe current directory
-        for item in self.root.iterdir():
-            if item.name == REPO_DIR_NAME: continue
-            if item.is_dir(): shutil.rmtree(item)
-            else: item.unlink()
+        # 1. Wipe the files from the walk above; ignored paths are left alone
+        dirs = set()
+        for entry in current_files.values():
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+            # Remember every ancestor below the root so emptied folders can go too
+            parent = os.path.dirname(entry.path)
+            while len(parent) > len(str(self.root)) and parent not in dirs:
+                dirs.add(parent)
+                parent = os.path.dirname(parent)
+        for directory in sorted(dirs, key=len, reverse=True):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass  # Still holds ignored files
 
         # 2. Copy back
-        # We walk the snapshot dir directly to ensure we get the actual files stored
-        snapshot_files_raw = []
-        for root, dirs, files in os.walk(target_snapshot):
-            for file in files:
-                full_path = Path(root) / file
-                rel_path = full_path.relative_to(target_snapshot)
-                snapshot_files_raw.append(rel_path)
-
-        for file_rel in snapshot_files_raw:
-            src = target_snapshot / file_rel
+        for file_rel, stored_path in stored.items():
             dst = self.root / file_rel
             dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src, dst)
+            self._restore_file(target_commit, file_rel, stored_path, dst)
 
         print(f"✅ Restored to {version_tag}")
 
@@ -280,42 +829,43 @@ class VibeVC:
         if not version_tag:
             version_tag = manifest[-1]['version']
 
-        snapshot_dir = self.snapshots_path / version_tag
-        if not snapshot_dir.exists():
+        target_commit = self._get_commit_by_tag(version_tag)
+        if not target_commit:
             print(f"(!) Version {version_tag} not found.")
             return
 
         print(f"Diffing against {version_tag}...\n")
         
-        current_files = set(self._get_files(self.root))
+        current_entries = self._get_files(self.root)
+        current_files = current_entries.keys()
         # Get files present in that snapshot
-        snapshot_files_iter = []
-        for root, dirs, files in os.walk(snapshot_dir):
-            for file in files:
-                rel = Path(root).relative_to(snapshot_dir) / file
-                snapshot_files_iter.append(str(rel))
-        snapshot_files = set(snapshot_files_iter)
+        snapshot_files = set(self._snapshot_files(target_commit))
         
-        all_files = sorted(current_files.union(snapshot_files))
+        all_files = sorted(current_files | snapshot_files)
+        # Check sizes and hashes first to see if we even need to diff
+        common = current_files & snapshot_files
+        differing = self._differing_files(target_commit, {f: current_entries[f] for f in common})
         
         for file in all_files:
-            curr_path = self.root / file
-            snap_path = snapshot_dir / file
-            
-            if file in current_files and file in snapshot_files:
-                # Calculate hashes first to see if we even need to diff
-                if self._hash_file(curr_path) == self._hash_file(snap_path):
+            if file in common:
+                if file not in differing:
                     continue
 
+                curr_path = self.root / file
+
                 try:
                     with open(curr_path, 'r', encoding='utf-8') as f1, \
-                         open(snap_path, 'r', encoding='utf-8') as f2:
-                        diff = list(difflib.unified_diff(
+                         io.TextIOWrapper(self._open_snapshot(target_commit, file), encoding='utf-8') as f2:
+                        diff = list(self._unified_diff(
                             f2.readlines(), f1.readlines(), 
                             fromfile=f"{version_tag}/{file}", 
                             tofile=f"Current/{file}"
                         ))
                         if diff: print("".join(diff))
+                except RuntimeError as e:
+                    # A missing optional package, not a binary file
+                    print(f"(!) Error: {e}")
+                    return
                 except:
                     print(f"Binary file {file} differs")
             
@@ -324,6 +874,16 @@ class VibeVC:
             elif file in snapshot_files:
                 print(f"- {file} (Deleted)")
 
+    def compact(self):
+        """Rewrite the manifest log as a clean snapshot of the history."""
+        if not self.repo_path.exists():
+            print("(!) No repository found.")
+            return
+
+        manifest = self._load_manifest()
+        self._save_manifest(manifest)
+        print(f"✅ Manifest compacted ({len(manifest)} commits)")
+
 # --- CLI Entry Point ---
 
 def main():
@@ -353,16 +913,25 @@ def main():
     diff_parser = subparsers.add_parser("diff", help="Show changes")
     diff_parser.add_argument("version", nargs="?", help="Version to diff against")
 
+    # Compact
+    subparsers.add_parser("compact", help="Rewrite the manifest log")
+
     args = parser.parse_args()
     vc = VibeVC(os.getcwd())
 
-    if args.command == "init": vc.init()
-    elif args.command == "status": vc.status()
-    elif args.command == "commit": vc.commit(args.message, args.version)
-    elif args.command == "log": vc.log()
-    elif args.command == "restore": vc.restore(args.version, args.force)
-    elif args.command == "diff": vc.diff(args.version)
-    else: parser.print_help()
+    try:
+        if args.command == "init": vc.init()
+        elif args.command == "status": vc.status()
+        elif args.command == "commit": vc.commit(args.message, args.version)
+        elif args.command == "log": vc.log()
+        elif args.command == "restore": vc.restore(args.version, args.force)
+        elif args.command == "diff": vc.diff(args.version)
+        elif args.command == "compact": vc.compact()
+        else: parser.print_help()
+    except RuntimeError as e:
+        # e.g. an optional package that an existing commit depends on is missing
+        print(f"(!) Error: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file